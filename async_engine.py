@@ -0,0 +1,351 @@
+import asyncio
+import logging
+import httpx
+from typing import Dict, Any, List, Optional, Set, Callable, Awaitable
+from notion_client import AsyncClient
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+from cache_manager import CollectionRecord
+from notion_properties import build_page_properties
+from profiler import Profiler
+from retry_policy import MAX_RETRIES, should_retry, retry_delay
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    def __init__(self, rate: float):
+        """按固定间隔放行请求，将平均速率限制在每秒 rate 个请求以内"""
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next_time = 0.0
+
+    async def acquire(self):
+        """等待到下一个可发送请求的时间点"""
+        now = asyncio.get_running_loop().time()
+        wait = self._next_time - now
+        self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """服务端要求降速时，暂停该服务的所有后续请求"""
+        resume_time = asyncio.get_running_loop().time() + seconds
+        self._next_time = max(self._next_time, resume_time)
+
+class AsyncSyncEngine:
+    def __init__(self, bgm_api_base: str, headers: Dict[str, str], notion_token: str, database_id: str,
+                 profiler: Optional[Profiler] = None, bgm_concurrency: int = 8, notion_concurrency: int = 3,
+                 bgm_rate_limit: float = 10, notion_rate_limit: float = 3, max_retries: int = MAX_RETRIES,
+                 bgm_timeout: float = 30, notion_base_url: str = "https://api.notion.com"):
+        """初始化异步同步引擎
+
+        Bangumi 和 Notion 分别限制并发请求数和每秒请求数，
+        遇到限流、服务端错误或网络错误时按 Retry-After 或指数退避重试。
+        """
+        self.bgm_api_base = bgm_api_base
+        self.headers = headers
+        self.notion_token = notion_token
+        self.notion_base_url = notion_base_url
+        self.database_id = database_id
+        self.profiler = profiler or Profiler()
+        self.bgm_concurrency = bgm_concurrency
+        self.notion_concurrency = notion_concurrency
+        self.bgm_rate_limit = bgm_rate_limit
+        self.notion_rate_limit = notion_rate_limit
+        self.max_retries = max_retries
+        self.bgm_timeout = bgm_timeout
+        self.bgm: Optional[httpx.AsyncClient] = None
+        self.notion: Optional[AsyncClient] = None
+        self._bgm_limit: Optional[asyncio.Semaphore] = None
+        self._notion_limit: Optional[asyncio.Semaphore] = None
+        self._bgm_rate: Optional[RateLimiter] = None
+        self._notion_rate: Optional[RateLimiter] = None
+        self._completed = 0
+
+    async def __aenter__(self) -> "AsyncSyncEngine":
+        # 信号量和连接池需要在事件循环内创建
+        self._bgm_limit = asyncio.Semaphore(self.bgm_concurrency)
+        self._notion_limit = asyncio.Semaphore(self.notion_concurrency)
+        self._bgm_rate = RateLimiter(self.bgm_rate_limit)
+        self._notion_rate = RateLimiter(self.notion_rate_limit)
+        self.bgm = httpx.AsyncClient(
+            base_url=self.bgm_api_base,
+            headers=self.headers,
+            timeout=self.bgm_timeout,
+            limits=httpx.Limits(max_connections=self.bgm_concurrency)
+        )
+        notion_http = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.notion_concurrency))
+        self.notion = AsyncClient(auth=self.notion_token, base_url=self.notion_base_url, client=notion_http)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.bgm.aclose()
+        await self.notion.aclose()
+
+    async def _request(self, host: str, span: str, send: Callable[[], Awaitable[Any]], idempotent: bool = True) -> Any:
+        """在对应服务的并发和速率限制内发送请求，失败时重试
+
+        非幂等请求只在 429 时重试。排队等待的时间单独记为 <host>.wait，span 只统计请求本身的耗时。
+        """
+        if host == "bangumi":
+            limit, rate = self._bgm_limit, self._bgm_rate
+        else:
+            limit, rate = self._notion_limit, self._notion_rate
+
+        attempt = 0
+        while True:
+            with self.profiler.span(f"{host}.wait"):
+                await limit.acquire()
+            try:
+                with self.profiler.span(f"{host}.wait"):
+                    await rate.acquire()
+                with self.profiler.span(span):
+                    result = await send()
+                # Bangumi 返回 httpx.Response，需要检查状态码；Notion 出错时直接抛出异常
+                status = getattr(result, "status_code", None)
+                if not should_retry(status, idempotent) or attempt >= self.max_retries:
+                    return result
+                retry_after = result.headers.get("Retry-After")
+            except HTTPResponseError as e:
+                status = e.status
+                if not should_retry(status, idempotent) or attempt >= self.max_retries:
+                    raise
+                retry_after = e.headers.get("Retry-After")
+            except (httpx.TransportError, RequestTimeoutError) as e:
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                status = type(e).__name__
+                retry_after = None
+            finally:
+                limit.release()
+
+            delay = retry_delay(attempt, retry_after)
+            # 被限流时暂停该服务的全部请求，而不只是当前请求
+            if status == 429 or retry_after:
+                rate.pause(delay)
+            attempt += 1
+            logger.warning(f"{host} 请求失败: {status}，{delay:.1f} 秒后第 {attempt} 次重试")
+            await asyncio.sleep(delay)
+
+    async def _bgm_get(self, path: str, span: str, **kwargs) -> httpx.Response:
+        """发送 Bangumi GET 请求"""
+        return await self._request("bangumi", span, lambda: self.bgm.get(path, **kwargs))
+
+    async def _notion_call(self, span: str, method, idempotent: bool = True, **kwargs) -> Dict[str, Any]:
+        """调用 Notion API"""
+        return await self._request("notion", span, lambda: method(**kwargs), idempotent)
+
+    async def get_user_collections(self, username: str, limit: int = 50, offset: int = 0) -> Optional[Dict[str, Any]]:
+        """获取用户收藏"""
+        params = {
+            "limit": limit,
+            "offset": offset
+        }
+        response = await self._bgm_get(f"/v0/users/{username}/collections", "get_user_collections", params=params)
+
+        if response.status_code == 200:
+            return response.json()
+        else:
+            logger.error(f"获取收藏失败: {response.status_code}")
+            logger.error(response.text)
+            return None
+
+    async def get_subject_detail(self, subject_id: int) -> Optional[Dict[str, Any]]:
+        """获取条目详细信息"""
+        response = await self._bgm_get(f"/v0/subjects/{subject_id}", "get_subject_detail")
+
+        if response.status_code == 200:
+            return response.json()
+        else:
+            logger.error(f"获取条目详情失败: {response.status_code}")
+            logger.error(response.text)
+            return None
+
+    async def get_subject_image(self, subject_id: int) -> Optional[str]:
+        """获取条目封面图片"""
+        response = await self._bgm_get(f"/v0/subjects/{subject_id}/image", "get_subject_image", params={"type": "large"})
+
+        if response.status_code == 302:
+            return response.headers.get('Location')
+        else:
+            logger.error(f"获取条目封面失败: {response.status_code}")
+            return None
+
+    async def fetch_all_collections(self, username: str) -> Optional[List[CollectionRecord]]:
+        """获取用户全部收藏，首页之后的分页并发请求"""
+        collections = await self.get_user_collections(username)
+
+        if not collections:
+            logger.info("未获取到收藏数据")
+            return None
+
+        total = collections["total"]
+        logger.info(f"共有 {total} 条收藏")
+
+        records = [CollectionRecord.from_dict(item) for item in collections["data"]]
+
+        pages = await asyncio.gather(*(
+            self.get_user_collections(username, offset=offset) for offset in range(50, total, 50)
+        ))
+
+        # 与同步引擎一致，遇到第一个失败的分页即停止合并
+        for page in pages:
+            if not page:
+                break
+            records.extend(CollectionRecord.from_dict(item) for item in page["data"])
+
+        return records
+
+    async def query_existing_pages(self, subject_id: int) -> List[Dict[str, Any]]:
+        """查询数据库中 ID 相同的已有条目"""
+        query_params = {
+            "filter": {
+                "property": "ID",
+                "number": {
+                    "equals": subject_id
+                }
+            }
+        }
+        response = await self._notion_call("notion.query", self.notion.databases.query, database_id=self.database_id, **query_params)
+        return response.get("results", [])
+
+    async def _create_page(self, record: CollectionRecord, page_properties: Dict[str, Any]) -> Dict[str, Any]:
+        """创建页面
+
+        创建不是幂等操作，超时、网络错误或服务端错误时页面可能已经创建，
+        重试前先按条目 ID 查询，已存在时不再重复创建。
+        """
+        attempt = 0
+        while True:
+            try:
+                return await self._notion_call("notion.write", self.notion.pages.create, idempotent=False, **page_properties)
+            except (HTTPResponseError, httpx.TransportError, RequestTimeoutError) as e:
+                status = getattr(e, "status", None)
+                # 429 已在 _request 中重试过，其他 4xx 重试也不会成功
+                if (status is not None and (status == 429 or not should_retry(status))) or attempt >= self.max_retries:
+                    raise
+                retry_after = e.headers.get("Retry-After") if isinstance(e, HTTPResponseError) else None
+                delay = retry_delay(attempt, retry_after)
+                attempt += 1
+                logger.warning(f"创建页面失败: {status or type(e).__name__}，{delay:.1f} 秒后确认页面是否已创建")
+                with self.profiler.span("notion.wait"):
+                    await asyncio.sleep(delay)
+                existing_pages = await self.query_existing_pages(record.subject_id)
+                if existing_pages:
+                    logger.warning(f"页面已创建，不再重试: ID {record.subject_id}")
+                    return existing_pages[0]
+
+    async def add_to_notion_database(self, record: CollectionRecord, total_count: int = 0) -> bool:
+        """将收藏记录添加或更新到 Notion 数据库，写入成功时返回 True
+
+        任何一步出错都只影响当前条目，不会中断其他条目的写入。
+        """
+        try:
+            # 查询已有条目的同时获取条目详情和封面
+            existing_pages, subject_detail, cover_image = await asyncio.gather(
+                self.query_existing_pages(record.subject_id),
+                self.get_subject_detail(record.subject_id),
+                self.get_subject_image(record.subject_id)
+            )
+
+            # 处理重复条目，只保留一个（如果有多个相同ID的条目）
+            if len(existing_pages) > 1:
+                logger.warning(f"发现ID为 {record.subject_id} 的重复条目，共 {len(existing_pages)} 条，将只保留最新的一条")
+                existing_pages.sort(key=lambda x: x.get("last_edited_time", ""), reverse=True)
+                for page in existing_pages[1:]:
+                    try:
+                        await self._notion_call("notion.write", self.notion.pages.update, page_id=page["id"], archived=True)
+                        logger.info(f"已归档重复条目: ID {record.subject_id}")
+                    except Exception as e:
+                        logger.error(f"归档重复条目失败: ID {record.subject_id} - {str(e)}")
+                existing_pages = [existing_pages[0]]
+
+            with self.profiler.span("build_page_properties"):
+                page_properties = build_page_properties(record, subject_detail, cover_image)
+
+            if existing_pages:
+                await self._notion_call("notion.write", self.notion.pages.update, page_id=existing_pages[0]["id"], **page_properties)
+                action = "已更新"
+            else:
+                page_properties["parent"] = {"database_id": self.database_id}
+                await self._create_page(record, page_properties)
+                action = "已添加"
+            self._completed += 1
+            progress = self._completed / total_count * 100 if total_count > 0 else 0
+            logger.info(f"{action}: [进度: {progress:.1f}%]")
+            return True
+        except Exception as e:
+            logger.error(f"操作失败: [条目ID: {record.subject_id}] - {str(e)}")
+            return False
+
+    async def sync_records(self, added_items: List[CollectionRecord], updated_items: List[CollectionRecord],
+                           on_success: Optional[Callable[[CollectionRecord], None]] = None) -> Set[int]:
+        """并发写入新增和更新的条目，返回写入成功的条目 ID
+
+        notion_concurrency 个任务依次从队列中取出条目，每个条目写入完成后才处理下一条，
+        写入和 on_success 能跟上查询的进度，同时只有少量条目的详情保留在内存中。
+        """
+        total_items = len(added_items) + len(updated_items)
+        self._completed = 0
+        succeeded_ids = set()
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for record in added_items + updated_items:
+            queue.put_nowait(record)
+
+        async def worker():
+            while not queue.empty():
+                record = queue.get_nowait()
+                with self.profiler.span("add_to_notion_database"):
+                    succeeded = await self.add_to_notion_database(record, total_items)
+                if succeeded:
+                    succeeded_ids.add(record.subject_id)
+                    if on_success:
+                        on_success(record)
+
+        await asyncio.gather(*(worker() for _ in range(self.notion_concurrency)))
+        return succeeded_ids
+
+    async def mark_deleted_items(self, bgm_subject_ids: Set[int]):
+        """将在 Notion 中存在但在 Bangumi 中不存在的条目标记为删除"""
+        # 分页游标只能依次获取
+        all_pages = []
+        has_more = True
+        start_cursor = None
+
+        while has_more:
+            query_params = {}
+            if start_cursor:
+                query_params["start_cursor"] = start_cursor
+
+            response = await self._notion_call("notion.query", self.notion.databases.query, database_id=self.database_id, **query_params)
+            all_pages.extend(response.get("results", []))
+            has_more = response.get("has_more", False)
+            start_cursor = response.get("next_cursor")
+
+        logger.info(f"Notion 数据库中共有 {len(all_pages)} 条记录")
+
+        async def mark(page) -> bool:
+            try:
+                subject_id = page["properties"]["ID"]["number"]
+                current_status = page["properties"]["收藏状态"]["select"]["name"] if page["properties"]["收藏状态"]["select"] else ""
+
+                if subject_id not in bgm_subject_ids and current_status != "删除":
+                    await self._notion_call(
+                        "notion.write",
+                        self.notion.pages.update,
+                        page_id=page["id"],
+                        properties={
+                            "收藏状态": {
+                                "select": {
+                                    "name": "删除"
+                                }
+                            }
+                        }
+                    )
+                    logger.info(f"已标记为删除: ID {subject_id}")
+                    return True
+            except Exception as e:
+                logger.error(f"处理条目时出错: {str(e)}")
+            return False
+
+        results = await asyncio.gather(*(mark(page) for page in all_pages))
+        logger.info(f"共标记 {sum(results)} 条记录为删除状态")
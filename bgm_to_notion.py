@@ -1,10 +1,19 @@
 import os
+import sys
+import time
+import asyncio
+import httpx
 import requests
 import logging
 from dotenv import load_dotenv
 from notion_client import Client
-from cache_manager import CacheManager
+from notion_client.errors import HTTPResponseError, RequestTimeoutError
+from cache_manager import CacheManager, CollectionRecord, shard_of, unique_records
 from env_manager import update_env_file
+from profiler import Profiler
+from notion_properties import build_page_properties
+from async_engine import AsyncSyncEngine
+from retry_policy import MAX_RETRIES, should_retry, retry_delay
 
 # 配置日志记录
 logging.basicConfig(
@@ -24,14 +33,30 @@ NOTION_TOKEN = os.getenv('NOTION_TOKEN')
 NOTION_PAGE_ID = os.getenv('NOTION_PAGE_ID')
 NOTION_DATABASE_ID = os.getenv('NOTION_DATABASE_ID')  # 新增：从环境变量获取数据库ID
 
+# 分片同步配置：SHARD_INDEX 为当前分片序号（从 0 开始），为 merge 时执行合并步骤
+SHARD_COUNT = os.getenv('SHARD_COUNT')
+SHARD_INDEX = os.getenv('SHARD_INDEX')
+
+# 同步引擎：sync 为默认的同步实现，async 为基于 asyncio 的并发实现
+SYNC_ENGINE = os.getenv('SYNC_ENGINE', 'sync').lower()
+# 异步引擎对各服务的最大并发请求数和每秒请求数，分片模式下每秒请求数为所有分片的总和
+BGM_CONCURRENCY = int(os.getenv('BGM_CONCURRENCY') or 8)
+NOTION_CONCURRENCY = int(os.getenv('NOTION_CONCURRENCY') or 3)
+BGM_RATE_LIMIT = float(os.getenv('BGM_RATE_LIMIT') or 10)
+NOTION_RATE_LIMIT = float(os.getenv('NOTION_RATE_LIMIT') or 3)
+
+# API 基础 URL，可以指向本地的替身服务器进行测试
+BGM_API_BASE = os.getenv('BGM_API_BASE') or "https://api.bgm.tv"
+NOTION_API_BASE = os.getenv('NOTION_API_BASE') or "https://api.notion.com"
+
 # 初始化 Notion 客户端
-notion = Client(auth=NOTION_TOKEN)
+notion = Client(auth=NOTION_TOKEN, base_url=NOTION_API_BASE)
 
 # 初始化缓存管理器
 cache_manager = CacheManager()
 
-# Bangumi API 基础 URL
-BGM_API_BASE = "https://api.bgm.tv"
+# 初始化性能分析器（通过 PROFILE 环境变量开启）
+profiler = Profiler.from_env()
 
 # 请求头
 headers = {
@@ -39,13 +64,61 @@ headers = {
     "Authorization": f"Bearer {BGM_TOKEN}"
 }
 
-def get_user_collections(username, subject_type=None, collection_type=None, limit=50):
+def run_async(step, database_id=None):
+    """创建异步引擎并在新的事件循环中执行一个同步步骤"""
+    async def runner():
+        async with AsyncSyncEngine(
+            BGM_API_BASE, headers, NOTION_TOKEN, database_id or NOTION_DATABASE_ID,
+            profiler=profiler,
+            bgm_concurrency=BGM_CONCURRENCY,
+            notion_concurrency=NOTION_CONCURRENCY,
+            bgm_rate_limit=BGM_RATE_LIMIT,
+            notion_rate_limit=NOTION_RATE_LIMIT,
+            notion_base_url=NOTION_API_BASE
+        ) as engine:
+            return await step(engine)
+    
+    return asyncio.run(runner())
+
+def request_with_retry(host, span, send, idempotent=True):
+    """发送请求，遇到限流、服务端错误或网络错误时按 Retry-After 或指数退避重试
+
+    非幂等请求只在 429 时重试。退避等待的时间单独记为 <host>.wait，span 只统计请求本身的耗时。
+    """
+    attempt = 0
+    while True:
+        try:
+            with profiler.span(span):
+                result = send()
+            # Bangumi 返回 requests.Response，需要检查状态码；Notion 出错时直接抛出异常
+            status = getattr(result, "status_code", None)
+            if not should_retry(status, idempotent) or attempt >= MAX_RETRIES:
+                return result
+            retry_after = result.headers.get("Retry-After")
+        except HTTPResponseError as e:
+            status = e.status
+            if not should_retry(status, idempotent) or attempt >= MAX_RETRIES:
+                raise
+            retry_after = e.headers.get("Retry-After")
+        except (requests.ConnectionError, requests.Timeout, httpx.TransportError, RequestTimeoutError) as e:
+            if not idempotent or attempt >= MAX_RETRIES:
+                raise
+            status = type(e).__name__
+            retry_after = None
+        
+        delay = retry_delay(attempt, retry_after)
+        attempt += 1
+        logger.warning(f"{host} 请求失败: {status}，{delay:.1f} 秒后第 {attempt} 次重试")
+        with profiler.span(f"{host}.wait"):
+            time.sleep(delay)
+
+def get_user_collections(username, subject_type=None, collection_type=None, limit=50, offset=0):
     """获取用户收藏"""
     url = f"{BGM_API_BASE}/v0/users/{username}/collections"
     
     params = {
         "limit": limit,
-        "offset": 0
+        "offset": offset
     }
     
     if subject_type:
@@ -54,7 +127,7 @@ def get_user_collections(username, subject_type=None, collection_type=None, limi
     if collection_type:
         params["type"] = collection_type
     
-    response = requests.get(url, headers=headers, params=params)
+    response = request_with_retry("bangumi", "get_user_collections", lambda: requests.get(url, headers=headers, params=params))
     
     if response.status_code == 200:
         return response.json()
@@ -67,7 +140,7 @@ def get_subject_detail(subject_id):
     """获取条目详细信息"""
     url = f"{BGM_API_BASE}/v0/subjects/{subject_id}"
     
-    response = requests.get(url, headers=headers)
+    response = request_with_retry("bangumi", "get_subject_detail", lambda: requests.get(url, headers=headers))
     
     if response.status_code == 200:
         return response.json()
@@ -162,7 +235,10 @@ def get_subject_image(subject_id):
         "type": "large"  # 获取大图
     }
     
-    response = requests.get(url, headers=headers, params=params, allow_redirects=False)
+    response = request_with_retry(
+        "bangumi", "get_subject_image",
+        lambda: requests.get(url, headers=headers, params=params, allow_redirects=False)
+    )
     
     if response.status_code == 302:
         return response.headers.get('Location')
@@ -170,188 +246,103 @@ def get_subject_image(subject_id):
         logger.error(f"获取条目封面失败: {response.status_code}")
         return None
 
-def add_to_notion_database(database_id, collection, current_index=0, total_count=0):
-    """将收藏添加或更新到 Notion 数据库"""
-    subject = collection["subject"]
-    
-    # 计算进度百分比
-    progress = (current_index + 1) / total_count * 100 if total_count > 0 else 0
-    
-    # 查询是否已存在该条目
+def query_existing_pages(database_id, subject_id):
+    """查询数据库中 ID 相同的已有条目"""
     query_params = {
         "filter": {
             "property": "ID",
             "number": {
-                "equals": subject["id"]
-            }
-        }
-    }
-    
-    existing_pages = notion.databases.query(database_id=database_id, **query_params).get("results", [])
-    
-    # 处理重复条目，只保留一个（如果有多个相同ID的条目）
-    if len(existing_pages) > 1:
-        logger.warning(f"发现ID为 {subject['id']} 的重复条目，共 {len(existing_pages)} 条，将只保留最新的一条")
-        # 按更新时间排序，保留最新的一条
-        existing_pages.sort(key=lambda x: x.get("last_edited_time", ""), reverse=True)
-        # 删除多余的条目
-        for page in existing_pages[1:]:
-            try:
-                notion.pages.update(page_id=page["id"], archived=True)
-                logger.info(f"已归档重复条目: ID {subject['id']}")
-            except Exception as e:
-                logger.error(f"归档重复条目失败: ID {subject['id']} - {str(e)}")
-        # 只保留最新的一条用于更新
-        existing_pages = [existing_pages[0]]
-    
-    # 获取更详细的条目信息
-    subject_detail = get_subject_detail(subject["id"])
-    
-    # 获取条目封面图片
-    cover_image = get_subject_image(subject["id"])
-    
-    # 收藏状态映射
-    collection_type_map = {
-        1: "想看",
-        2: "看过",
-        3: "在看",
-        4: "搁置",
-        5: "抛弃"
-    }
-    
-    # 条目类型映射
-    subject_type_map = {
-        1: "书籍",
-        2: "动画",
-        3: "音乐",
-        4: "游戏",
-        6: "三次元"
-    }
-    
-    properties = {
-        "标题": {
-            "title": [
-                {
-                    "text": {
-                        "content": subject["name"]
-                    }
-                }
-            ]
-        },
-        "中文名": {
-            "rich_text": [
-                {
-                    "text": {
-                        "content": subject["name_cn"] if subject["name_cn"] else ""
-                    }
-                }
-            ]
-        },
-        "类型": {
-            "select": {
-                "name": subject_type_map.get(subject["type"], "未知")
-            }
-        },
-        "ID": {
-            "number": subject["id"]
-        },
-        "链接": {
-            "url": f"https://bgm.tv/subject/{subject['id']}"
-        },
-        "收藏状态": {
-            "select": {
-                "name": collection_type_map.get(collection["type"], "未知")
+                "equals": subject_id
             }
         }
     }
+    response = request_with_retry("notion", "notion.query", lambda: notion.databases.query(database_id=database_id, **query_params))
+    return response.get("results", [])
+
+def create_page(database_id, record, page_properties):
+    """创建页面
+
+    创建不是幂等操作，超时、网络错误或服务端错误时页面可能已经创建，
+    重试前先按条目 ID 查询，已存在时不再重复创建。
+    """
+    attempt = 0
+    while True:
+        try:
+            return request_with_retry("notion", "notion.write", lambda: notion.pages.create(**page_properties), idempotent=False)
+        except (HTTPResponseError, httpx.TransportError, RequestTimeoutError) as e:
+            status = getattr(e, "status", None)
+            # 429 已在 request_with_retry 中重试过，其他 4xx 重试也不会成功
+            if (status is not None and (status == 429 or not should_retry(status))) or attempt >= MAX_RETRIES:
+                raise
+            retry_after = e.headers.get("Retry-After") if isinstance(e, HTTPResponseError) else None
+            delay = retry_delay(attempt, retry_after)
+            attempt += 1
+            logger.warning(f"创建页面失败: {status or type(e).__name__}，{delay:.1f} 秒后确认页面是否已创建")
+            with profiler.span("notion.wait"):
+                time.sleep(delay)
+            existing_pages = query_existing_pages(database_id, record.subject_id)
+            if existing_pages:
+                logger.warning(f"页面已创建，不再重试: ID {record.subject_id}")
+                return existing_pages[0]
+
+def add_to_notion_database(database_id, record, current_index=0, total_count=0):
+    """将收藏记录添加或更新到 Notion 数据库，写入成功时返回 True
+
+    任何一步出错都只影响当前条目，不会中断其他条目的写入。
+    """
+    # 计算进度百分比
+    progress = (current_index + 1) / total_count * 100 if total_count > 0 else 0
     
-    # 添加封面图片（如果有）
-    if cover_image:
-        properties["封面"] = {
-            "files": [
-                {
-                    "name": f"封面-{subject['id']}",
-                    "type": "external",
-                    "external": {
-                        "url": cover_image
-                    }
-                }
-            ]
-        }
-    
-    # 添加评分信息（如果有）
-    if subject_detail and "rating" in subject_detail:
-        properties["评分"] = {
-            "number": subject_detail["rating"]["score"]
-        }
-        properties["评分人数"] = {
-            "number": subject_detail["rating"]["total"]
-        }
-        if "rank" in subject_detail["rating"] and subject_detail["rating"]["rank"]:
-            properties["排名"] = {
-                "number": subject_detail["rating"]["rank"]
-            }
-    
-    # 添加发行日期（如果有）
-    if subject_detail and "date" in subject_detail and subject_detail["date"]:
-        properties["发行日期"] = {
-            "date": {
-                "start": subject_detail["date"]
-            }
-        }
-    
-    # 添加标签信息（如果有）
-    if subject_detail and "tags" in subject_detail:
-        tags = []
-        for tag in subject_detail["tags"]:
-            tags.append({"name": tag["name"]})
-        if tags:
-            properties["标签"] = {
-                "multi_select": tags
-            }
-    
-    # 添加剧集数（如果有）
-    if subject_detail and "eps" in subject_detail:
-        properties["剧集数"] = {
-            "number": subject_detail["eps"]
-        }
-    
-    # 添加观看进度
-    if "ep_status" in collection:
-        properties["观看进度"] = {
-            "number": collection["ep_status"]
-        }
-    
-    # 更新或创建条目
     try:
-        page_properties = {
-            "properties": properties
-        }
+        # 查询是否已存在该条目
+        existing_pages = query_existing_pages(database_id, record.subject_id)
         
-        # 如果有封面图片，设置为页面封面
-        if cover_image:
-            page_properties["cover"] = {
-                "type": "external",
-                "external": {
-                    "url": cover_image
-                }
-            }
+        # 处理重复条目，只保留一个（如果有多个相同ID的条目）
+        if len(existing_pages) > 1:
+            logger.warning(f"发现ID为 {record.subject_id} 的重复条目，共 {len(existing_pages)} 条，将只保留最新的一条")
+            # 按更新时间排序，保留最新的一条
+            existing_pages.sort(key=lambda x: x.get("last_edited_time", ""), reverse=True)
+            # 删除多余的条目
+            for page in existing_pages[1:]:
+                try:
+                    request_with_retry("notion", "notion.write", lambda: notion.pages.update(page_id=page["id"], archived=True))
+                    logger.info(f"已归档重复条目: ID {record.subject_id}")
+                except Exception as e:
+                    logger.error(f"归档重复条目失败: ID {record.subject_id} - {str(e)}")
+            # 只保留最新的一条用于更新
+            existing_pages = [existing_pages[0]]
+        
+        # 获取更详细的条目信息
+        subject_detail = get_subject_detail(record.subject_id)
+        
+        # 获取条目封面图片
+        cover_image = get_subject_image(record.subject_id)
+        
+        # 构建页面属性
+        with profiler.span("build_page_properties"):
+            page_properties = build_page_properties(record, subject_detail, cover_image)
         
+        # 更新或创建条目
         if existing_pages:
             # 更新现有条目
             page_id = existing_pages[0]["id"]
-            notion.pages.update(page_id=page_id, **page_properties)
+            request_with_retry("notion", "notion.write", lambda: notion.pages.update(page_id=page_id, **page_properties))
             logger.info(f"已更新: [进度: {progress:.1f}%]")
         else:
             # 创建新条目
             page_properties["parent"] = {"database_id": database_id}
-            notion.pages.create(**page_properties)
+            create_page(database_id, record, page_properties)
             logger.info(f"已添加: [进度: {progress:.1f}%]")
+        return True
     except Exception as e:
-        logger.error(f"操作失败: [条目ID: {subject['id']}] - {str(e)}")
+        logger.error(f"操作失败: [条目ID: {record.subject_id}] - {str(e)}")
+        return False
 
 def mark_deleted_items(database_id, bgm_subject_ids):
     """将在 Notion 中存在但在 Bangumi 中不存在的条目标记为删除"""
+    if SYNC_ENGINE == "async":
+        return run_async(lambda engine: engine.mark_deleted_items(bgm_subject_ids), database_id)
+    
     # 获取 Notion 数据库中的所有条目
     all_pages = []
     has_more = True
@@ -362,7 +353,7 @@ def mark_deleted_items(database_id, bgm_subject_ids):
         if start_cursor:
             query_params["start_cursor"] = start_cursor
         
-        response = notion.databases.query(database_id=database_id, **query_params)
+        response = request_with_retry("notion", "notion.query", lambda: notion.databases.query(database_id=database_id, **query_params))
         all_pages.extend(response.get("results", []))
         has_more = response.get("has_more", False)
         start_cursor = response.get("next_cursor")
@@ -380,7 +371,7 @@ def mark_deleted_items(database_id, bgm_subject_ids):
             
             # 如果条目不在 Bangumi 收藏中且状态不是"删除"
             if subject_id not in bgm_subject_ids and current_status != "删除":
-                notion.pages.update(
+                request_with_retry("notion", "notion.write", lambda: notion.pages.update(
                     page_id=page["id"],
                     properties={
                         "收藏状态": {
@@ -389,7 +380,7 @@ def mark_deleted_items(database_id, bgm_subject_ids):
                             }
                         }
                     }
-                )
+                ))
                 deleted_count += 1
                 logger.info(f"已标记为删除: ID {subject_id}")
         except Exception as e:
@@ -400,7 +391,7 @@ def mark_deleted_items(database_id, bgm_subject_ids):
 def get_user_info():
     """从 Bangumi API 获取当前用户信息"""
     url = f"{BGM_API_BASE}/v0/me"
-    response = requests.get(url, headers=headers)
+    response = request_with_retry("bangumi", "get_user_info", lambda: requests.get(url, headers=headers))
     
     if response.status_code == 200:
         return response.json()
@@ -478,36 +469,30 @@ def update_notion_database(database_id):
         logger.error("更新数据库属性失败")
         return False
 
-def main():
-    logger.info("开始同步 Bangumi 收藏到 Notion...")
-    
-    # 获取用户信息
-    user_info = get_user_info()
-    if not user_info:
-        logger.error("获取用户信息失败，请检查 BGM_TOKEN 是否正确")
-        return
-    
-    username = user_info["username"]
-    logger.info("已获取 Bangumi 用户信息")
-    
-    # 检查或创建数据库
+def prepare_database(allow_create=True):
+    """检查或创建 Notion 数据库并更新其属性，成功时返回 True"""
     global NOTION_DATABASE_ID
     if not NOTION_DATABASE_ID:
         # 尝试从缓存加载数据库ID
         NOTION_DATABASE_ID = cache_manager.load_database_id()
-        
+    
     if not NOTION_DATABASE_ID:
+        if not allow_create:
+            logger.error("错误：未找到 Notion 数据库 ID，分片模式下不会创建新的数据库")
+            return False
         logger.info("未找到 Notion 数据库 ID，将创建新的数据库...")
         NOTION_DATABASE_ID = create_notion_database()
         if not NOTION_DATABASE_ID:
             logger.error("错误：创建数据库失败")
-            return
+            return False
         # 保存新创建的数据库ID到缓存
         cache_manager.save_database_id(NOTION_DATABASE_ID)
     
     # 更新数据库属性
     if not update_notion_database(NOTION_DATABASE_ID):
         logger.error("错误：更新数据库属性失败，请检查数据库ID是否正确")
+        if not allow_create:
+            return False
         logger.error("数据库ID可能已失效，将清除所有缓存并重新创建数据库...")
         # 删除所有缓存文件
         if os.path.exists(cache_manager.db_cache_file):
@@ -521,82 +506,272 @@ def main():
         NOTION_DATABASE_ID = create_notion_database()
         if not NOTION_DATABASE_ID:
             logger.error("错误：创建数据库失败")
-            return
+            return False
         # 保存新创建的数据库ID到缓存
         cache_manager.save_database_id(NOTION_DATABASE_ID)
         
         # 再次尝试更新数据库属性
         if not update_notion_database(NOTION_DATABASE_ID):
             logger.error("错误：更新新创建的数据库属性失败")
-            return
+            return False
     
     logger.info(f"使用 Notion 数据库: {NOTION_DATABASE_ID}")
-    
-    # 加载本地缓存数据
-    logger.info("加载本地缓存数据...")
-    cached_collections = cache_manager.load_cache()
-    
-    # 获取用户收藏
-    logger.info("获取 Bangumi 收藏数据...")
+    return True
+
+def fetch_all_collections(username):
+    """分页获取用户全部收藏，返回去重后的精简记录列表"""
+    if SYNC_ENGINE == "async":
+        records = run_async(lambda engine: engine.fetch_all_collections(username))
+    else:
+        records = fetch_collection_pages(username)
+    # 之后的比较、缓存和删除判断都使用同一份去重后的列表
+    return unique_records(records) if records else records
+
+def fetch_collection_pages(username):
+    """依次请求收藏的每一页，返回精简记录列表"""
     collections = get_user_collections(username)
     
     if not collections:
         logger.info("未获取到收藏数据")
-        return
+        return None
     
     total = collections["total"]
     logger.info(f"共有 {total} 条收藏")
     
+    # 每页数据立即转换为精简记录，不保留完整的 JSON
+    records = [CollectionRecord.from_dict(item) for item in collections["data"]]
+    
     # 如果收藏数量超过一页，继续获取后续页面
     current_offset = 50
     while current_offset < total:
         # 获取下一页数据
-        params = {"offset": current_offset, "limit": 50}
-        url = f"{BGM_API_BASE}/v0/users/{username}/collections"
-        response = requests.get(url, headers=headers, params=params)
-        next_page = response.json() if response.status_code == 200 else None
+        next_page = get_user_collections(username, offset=current_offset)
         
         if not next_page:
             break
         
         # 合并数据
-        collections["data"].extend(next_page["data"])
+        records.extend(CollectionRecord.from_dict(item) for item in next_page["data"])
         current_offset += 50
     
-    # 保存最新数据到缓存
-    logger.info("保存最新数据到本地缓存...")
-    cache_manager.save_cache(collections)
+    return records
+
+def sync_records(added_items, updated_items, on_success=None):
+    """将新增和更新的条目写入 Notion 数据库，返回写入成功的条目 ID
+
+    on_success 会在每条记录写入成功后立即以该记录为参数调用。
+    """
+    if SYNC_ENGINE == "async":
+        return run_async(lambda engine: engine.sync_records(added_items, updated_items, on_success))
+    
+    total_items = len(added_items) + len(updated_items)
+    succeeded_ids = set()
+    
+    # 依次处理新增条目和更新条目
+    for current_index, record in enumerate(added_items + updated_items):
+        with profiler.span("add_to_notion_database"):
+            succeeded = add_to_notion_database(NOTION_DATABASE_ID, record, current_index, total_items)
+        if succeeded:
+            succeeded_ids.add(record.subject_id)
+            if on_success:
+                on_success(record)
+    
+    return succeeded_ids
+
+def get_shard_config():
+    """解析分片配置，返回 (SHARD_INDEX, SHARD_COUNT)，SHARD_INDEX 为分片序号或 "merge"，配置无效时返回 None"""
+    try:
+        shard_count = int(SHARD_COUNT or 0)
+        shard_index = SHARD_INDEX if SHARD_INDEX == "merge" else int(SHARD_INDEX)
+    except ValueError:
+        shard_count = shard_index = None
+    
+    if shard_count is None or shard_count < 2 or (shard_index != "merge" and not 0 <= shard_index < shard_count):
+        logger.error(f"错误：无效的分片配置 SHARD_INDEX={SHARD_INDEX}, SHARD_COUNT={SHARD_COUNT}")
+        return None
+    return shard_index, shard_count
+
+def main():
+    """执行同步，分片模式下失败时返回 False"""
+    if SHARD_INDEX:
+        shard_config = get_shard_config()
+        if not shard_config:
+            return False
+        shard_index, shard_count = shard_config
+        if shard_index == "merge":
+            return run_shard_merge(shard_count)
+        return run_shard_worker(shard_index, shard_count)
+    
+    logger.info("开始同步 Bangumi 收藏到 Notion...")
+    
+    # 获取用户信息
+    user_info = get_user_info()
+    if not user_info:
+        logger.error("获取用户信息失败，请检查 BGM_TOKEN 是否正确")
+        return
+    
+    username = user_info["username"]
+    logger.info("已获取 Bangumi 用户信息")
+    
+    # 检查或创建数据库
+    if not prepare_database():
+        return
+    
+    # 加载本地缓存数据
+    logger.info("加载本地缓存数据...")
+    with profiler.track_allocations("load_cache"), profiler.span("load_cache"):
+        cached_collections = cache_manager.load_cache()
+    
+    # 获取用户收藏
+    logger.info("获取 Bangumi 收藏数据...")
+    records = fetch_all_collections(username)
+    if not records:
+        return
     
     # 比较新旧数据，找出需要更新的条目
     logger.info("比较本地缓存与最新数据...")
-    added_items, updated_items, deleted_ids = cache_manager.compare_collections(collections, cached_collections)
+    with profiler.track_allocations("compare_collections"), profiler.span("compare_collections"):
+        added_items, updated_items, deleted_ids = cache_manager.compare_collections(records, cached_collections)
     
     logger.warning(f"发现 {len(added_items)} 个新增条目, {len(updated_items)} 个更新条目, {len(deleted_ids)} 个删除条目")
     
     # 记录所有 Bangumi 收藏的条目 ID
-    bgm_subject_ids = set()
-    for collection in collections["data"]:
-        bgm_subject_ids.add(collection["subject"]["id"])
+    bgm_subject_ids = {record.subject_id for record in records}
     
-    # 处理新增条目
-    total_items = len(added_items) + len(updated_items)
-    current_index = 0
-    
-    for collection in added_items:
-        add_to_notion_database(NOTION_DATABASE_ID, collection, current_index, total_items)
-        current_index += 1
+    succeeded_ids = sync_records(added_items, updated_items)
     
-    # 处理更新条目
-    for collection in updated_items:
-        add_to_notion_database(NOTION_DATABASE_ID, collection, current_index, total_items)
-        current_index += 1
+    # 保存最新数据到缓存，写入失败的条目保留旧缓存以便下次重试
+    logger.info("保存最新数据到本地缓存...")
+    with profiler.span("save_cache"):
+        cache_manager.save_cache(cache_manager.resolve_synced_records(records, cached_collections, added_items + updated_items, succeeded_ids))
+    del cached_collections
     
     # 处理删除条目
     if deleted_ids:
         print("\n开始处理已从 Bangumi 中删除的条目...")
-        mark_deleted_items(NOTION_DATABASE_ID, bgm_subject_ids)
+        with profiler.span("mark_deleted_items"):
+            mark_deleted_items(NOTION_DATABASE_ID, bgm_subject_ids)
     
     logger.info("同步完成!")
 
+def run_shard_worker(shard_index, shard_count):
+    """分片模式：只同步属于当前分片的条目，并写出分片缓存，成功时返回 True"""
+    global BGM_RATE_LIMIT, NOTION_RATE_LIMIT
+    logger.info(f"开始同步分片 {shard_index + 1}/{shard_count}...")
+    
+    # 各分片并行运行并共用同一组令牌，速率限制按分片数平均分配
+    BGM_RATE_LIMIT /= shard_count
+    NOTION_RATE_LIMIT /= shard_count
+    
+    user_info = get_user_info()
+    if not user_info:
+        logger.error("获取用户信息失败，请检查 BGM_TOKEN 是否正确")
+        return False
+    
+    # 各分片并行运行，不能各自创建数据库
+    if not prepare_database(allow_create=False):
+        return False
+    
+    # 只保留属于当前分片的缓存和收藏
+    with profiler.track_allocations("load_cache"), profiler.span("load_cache"):
+        cached_collections = {record.subject_id: record for record in cache_manager.load_cache()
+                              if shard_of(record.subject_id, shard_count) == shard_index}
+    
+    # 上次中断前已写入的条目记录在日志中，视为已同步以便从中断处继续
+    journal = cache_manager.load_journal(shard_index, shard_count)
+    if journal:
+        logger.warning(f"从分片日志恢复 {len(journal)} 条已写入的记录")
+    for record in journal:
+        cached_collections[record.subject_id] = record
+    cached_collections = list(cached_collections.values())
+    
+    records = fetch_all_collections(user_info["username"])
+    if not records:
+        return False
+    records = [record for record in records if shard_of(record.subject_id, shard_count) == shard_index]
+    
+    with profiler.track_allocations("compare_collections"), profiler.span("compare_collections"):
+        added_items, updated_items, _ = cache_manager.compare_collections(records, cached_collections)
+    
+    logger.warning(f"分片 {shard_index + 1}/{shard_count}: 发现 {len(added_items)} 个新增条目, {len(updated_items)} 个更新条目")
+    
+    succeeded_ids = sync_records(
+        added_items, updated_items,
+        on_success=lambda record: cache_manager.append_journal(record, shard_index, shard_count)
+    )
+    
+    # 分片缓存只记录写入成功或无需写入的条目，写入失败的保留旧缓存以便下次重试
+    shard_records = cache_manager.resolve_synced_records(records, cached_collections, added_items + updated_items, succeeded_ids)
+    with profiler.span("save_cache"):
+        saved = cache_manager.save_shard_cache(shard_records, [record.subject_id for record in records], shard_index, shard_count)
+    
+    failed_count = len(added_items) + len(updated_items) - len(succeeded_ids)
+    if failed_count:
+        logger.warning(f"分片 {shard_index + 1}/{shard_count}: {failed_count} 个条目写入失败，将在下次同步时重试")
+    logger.info(f"分片 {shard_index + 1}/{shard_count} 同步完成!")
+    return saved
+
+def run_shard_merge(shard_count):
+    """合并各分片缓存为完整缓存，并统一处理已删除的条目，所有分片均完成时返回 True
+
+    未完成的分片会把日志中已写入的记录合并进缓存，下次同步时从中断处继续，
+    但此时无法确定 Bangumi 上的完整收藏，因此不处理删除条目。
+    """
+    logger.info(f"开始合并 {shard_count} 个分片的缓存...")
+    
+    with profiler.track_allocations("load_cache"), profiler.span("load_cache"):
+        cached_collections = cache_manager.load_cache()
+    
+    records = []
+    bgm_subject_ids = set()
+    journaled = {}
+    incomplete_shards = set()
+    for shard_index in range(shard_count):
+        shard = cache_manager.load_shard_cache(shard_index, shard_count)
+        if shard is None:
+            incomplete_shards.add(shard_index)
+            for record in cache_manager.load_journal(shard_index, shard_count):
+                journaled[record.subject_id] = record
+        else:
+            shard_records, subject_ids = shard
+            records.extend(shard_records)
+            bgm_subject_ids.update(subject_ids)
+    
+    # 未完成的分片保留原有缓存，并用日志中已写入的记录覆盖
+    for record in cached_collections:
+        if shard_of(record.subject_id, shard_count) in incomplete_shards:
+            records.append(journaled.pop(record.subject_id, record))
+    records.extend(journaled.values())
+    
+    with profiler.span("save_cache"):
+        cache_manager.save_cache(records)
+    cache_manager.clear_shard_caches()
+    
+    if incomplete_shards:
+        missing = ", ".join(str(shard_index + 1) for shard_index in sorted(incomplete_shards))
+        logger.error(f"错误：分片 {missing} 未完成，已保存日志中的进度，跳过删除条目的处理")
+        return False
+    
+    deleted_ids = [record.subject_id for record in cached_collections if record.subject_id not in bgm_subject_ids]
+    del cached_collections
+    
+    logger.warning(f"合并完成，共 {len(records)} 条收藏, {len(deleted_ids)} 个删除条目")
+    
+    # 处理删除条目
+    if deleted_ids:
+        if not prepare_database(allow_create=False):
+            return False
+        with profiler.span("mark_deleted_items"):
+            mark_deleted_items(NOTION_DATABASE_ID, bgm_subject_ids)
+    
+    logger.info("同步完成!")
+    return True
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    profiler.start()
+    try:
+        succeeded = main()
+    finally:
+        profiler.stop()
+    if succeeded is False:
+        sys.exit(1)
@@ -1,16 +1,80 @@
 import os
 import json
+import zlib
 import logging
-from typing import Dict, Set, Any, Optional
+from typing import Dict, Set, Any, Optional, Iterable, List
 
 logger = logging.getLogger(__name__)
 
+class CollectionRecord:
+    """精简的收藏记录，只保留同步实际用到的字段"""
+    __slots__ = ("subject_id", "name", "name_cn", "subject_type", "type", "ep_status")
+    
+    def __init__(self, subject_id: int, name: str, name_cn: str, subject_type: int,
+                 type: int, ep_status: Optional[int] = None):
+        self.subject_id = subject_id
+        self.name = name
+        self.name_cn = name_cn
+        self.subject_type = subject_type
+        self.type = type
+        self.ep_status = ep_status
+    
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any]) -> "CollectionRecord":
+        """从 Bangumi API 或缓存中的收藏数据构建记录"""
+        subject = item["subject"]
+        return cls(
+            int(subject["id"]),
+            subject.get("name") or "",
+            subject.get("name_cn") or "",
+            subject.get("type"),
+            item.get("type"),
+            item.get("ep_status")
+        )
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为与 Bangumi API 结构一致的字典，用于写入缓存"""
+        item = {
+            "subject": {
+                "id": self.subject_id,
+                "name": self.name,
+                "name_cn": self.name_cn,
+                "type": self.subject_type
+            },
+            "type": self.type
+        }
+        if self.ep_status is not None:
+            item["ep_status"] = self.ep_status
+        return item
+    
+    def fingerprint(self) -> int:
+        """计算会写入 Notion 的字段的指纹，用于判断条目是否变化"""
+        return hash((self.type, self.ep_status, self.name, self.name_cn, self.subject_type))
+
+def unique_records(records: Iterable[CollectionRecord]) -> List[CollectionRecord]:
+    """去除条目 ID 重复的记录，只保留第一次出现的
+
+    分页过程中收藏发生变动时，同一条目可能出现在相邻的两页中。
+    """
+    seen_ids = set()
+    unique = []
+    for record in records:
+        if record.subject_id not in seen_ids:
+            seen_ids.add(record.subject_id)
+            unique.append(record)
+    return unique
+
+def shard_of(subject_id: int, shard_count: int) -> int:
+    """计算条目所属的分片，结果在不同进程和机器之间保持一致"""
+    return zlib.crc32(str(subject_id).encode()) % shard_count
+
 class CacheManager:
     def __init__(self, cache_dir: str = ".cache"):
         """初始化缓存管理器"""
         self.cache_dir = cache_dir
         self.cache_file = os.path.join(cache_dir, "bgm_cache.json")
         self.db_cache_file = os.path.join(cache_dir, "notion_db_cache.json")
+        self.shard_dir = os.path.join(cache_dir, "shards")
         self._ensure_cache_dir()
     
     def _ensure_cache_dir(self):
@@ -18,53 +82,148 @@ class CacheManager:
         if not os.path.exists(self.cache_dir):
             os.makedirs(self.cache_dir)
     
-    def save_cache(self, collections: Dict[str, Any]):
-        """保存收藏数据到缓存文件"""
+    def save_cache(self, records: List[CollectionRecord]):
+        """保存收藏记录到缓存文件"""
         try:
+            data = {
+                "data": [record.to_dict() for record in records],
+                "total": len(records)
+            }
             with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(collections, f, ensure_ascii=False, indent=2)
+                json.dump(data, f, ensure_ascii=False, indent=2)
             logger.info("缓存数据已保存")
         except Exception as e:
             logger.error(f"保存缓存数据失败: {str(e)}")
     
-    def load_cache(self) -> Dict[str, Any]:
-        """从缓存文件加载收藏数据"""
+    def load_cache(self) -> List[CollectionRecord]:
+        """从缓存文件加载收藏记录"""
         try:
             if os.path.exists(self.cache_file):
                 with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {"data": [], "total": 0}
+                    data = json.load(f).get("data", [])
+                return [CollectionRecord.from_dict(item) for item in data]
+            return []
         except Exception as e:
             logger.error(f"加载缓存数据失败: {str(e)}")
-            return {"data": [], "total": 0}
+            return []
     
-    def compare_collections(self, new_collections: Dict[str, Any], old_collections: Dict[str, Any]) -> tuple[list, list, list]:
-        """比较新旧收藏数据，返回需要更新的条目"""
-        new_items = {}
-        old_items = {}
-        
-        # 构建新旧数据的映射
-        for item in new_collections.get("data", []):
-            new_items[item["subject"]["id"]] = item
+    def shard_cache_file(self, shard_index: int, shard_count: int) -> str:
+        """返回分片缓存文件路径"""
+        return os.path.join(self.shard_dir, f"bgm_cache.shard-{shard_index}-of-{shard_count}.json")
+    
+    def journal_file(self, shard_index: int, shard_count: int) -> str:
+        """返回分片写入日志文件路径"""
+        return os.path.join(self.shard_dir, f"bgm_journal.shard-{shard_index}-of-{shard_count}.jsonl")
+    
+    def append_journal(self, record: CollectionRecord, shard_index: int, shard_count: int):
+        """每成功写入一条记录就追加到分片日志，任务中断时已完成的部分不会丢失"""
+        if not os.path.exists(self.shard_dir):
+            os.makedirs(self.shard_dir)
+        with open(self.journal_file(shard_index, shard_count), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+            f.flush()
+    
+    def load_journal(self, shard_index: int, shard_count: int) -> List[CollectionRecord]:
+        """加载分片日志中已成功写入的记录"""
+        journal_file = self.journal_file(shard_index, shard_count)
+        records = []
+        if not os.path.exists(journal_file):
+            return records
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(CollectionRecord.from_dict(json.loads(line)))
+                except (ValueError, KeyError):
+                    # 任务被强制终止时最后一行可能不完整
+                    logger.warning("跳过分片日志中不完整的记录")
+        return records
+    
+    def save_shard_cache(self, records: List[CollectionRecord], subject_ids: Iterable[int], shard_index: int, shard_count: int) -> bool:
+        """保存单个分片的收藏记录，以及该分片在 Bangumi 上的全部条目 ID"""
+        try:
+            if not os.path.exists(self.shard_dir):
+                os.makedirs(self.shard_dir)
+            data = {
+                "shard_index": shard_index,
+                "shard_count": shard_count,
+                "subject_ids": list(subject_ids),
+                "data": [record.to_dict() for record in records],
+                "total": len(records)
+            }
+            with open(self.shard_cache_file(shard_index, shard_count), 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            logger.info(f"分片缓存已保存: {shard_index + 1}/{shard_count}")
+            return True
+        except Exception as e:
+            logger.error(f"保存分片缓存失败: {str(e)}")
+            return False
+    
+    def load_shard_cache(self, shard_index: int, shard_count: int) -> Optional[tuple[List[CollectionRecord], Set[int]]]:
+        """加载单个分片的收藏记录和条目 ID，分片未完成时返回 None"""
+        shard_file = self.shard_cache_file(shard_index, shard_count)
+        try:
+            if not os.path.exists(shard_file):
+                return None
+            with open(shard_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            records = [CollectionRecord.from_dict(item) for item in data.get("data", [])]
+            return records, set(data.get("subject_ids", []))
+        except Exception as e:
+            logger.error(f"加载分片缓存失败: {str(e)}")
+            return None
+    
+    def clear_shard_caches(self):
+        """删除所有分片缓存文件"""
+        if not os.path.exists(self.shard_dir):
+            return
+        for name in os.listdir(self.shard_dir):
+            os.remove(os.path.join(self.shard_dir, name))
+        logger.info("已清除分片缓存")
+    
+    def resolve_synced_records(self, records: List[CollectionRecord], cached_records: Iterable[CollectionRecord],
+                               changed_records: Iterable[CollectionRecord], succeeded_ids: Set[int]) -> List[CollectionRecord]:
+        """返回同步后应写入缓存的记录
+
+        写入失败的条目保留旧的缓存记录（新增失败的则不写入缓存），下次同步时会被重新识别为变化。
+        """
+        failed_ids = {record.subject_id for record in changed_records} - succeeded_ids
+        if not failed_ids:
+            return records
         
-        for item in old_collections.get("data", []):
-            old_items[item["subject"]["id"]] = item
+        old_records = {record.subject_id: record for record in cached_records if record.subject_id in failed_ids}
+        resolved = []
+        for record in records:
+            if record.subject_id not in failed_ids:
+                resolved.append(record)
+            elif record.subject_id in old_records:
+                resolved.append(old_records[record.subject_id])
+        return resolved
+    
+    def compare_collections(self, new_records: Iterable[CollectionRecord], old_records: Iterable[CollectionRecord]) -> tuple[list, list, list]:
+        """比较新旧收藏记录，返回需要更新的条目"""
+        # 旧数据只保留 ID 到指纹的映射
+        old_fingerprints = {record.subject_id: record.fingerprint() for record in old_records}
         
         # 找出新增、更新和删除的条目
         added = []
         updated = []
-        deleted = list(set(old_items.keys()) - set(new_items.keys()))
+        seen_ids = set()
+        
+        for record in new_records:
+            # 分页过程中收藏变动可能导致重复条目，只处理第一次出现的
+            if record.subject_id in seen_ids:
+                continue
+            seen_ids.add(record.subject_id)
+            
+            old_fingerprint = old_fingerprints.get(record.subject_id)
+            if old_fingerprint is None:
+                added.append(record)
+            elif record.fingerprint() != old_fingerprint:
+                updated.append(record)
         
-        for subject_id, new_item in new_items.items():
-            if subject_id not in old_items:
-                added.append(new_item)
-            else:
-                # 比较收藏状态是否变化
-                old_item = old_items[subject_id]
-                if new_item["type"] != old_item["type"]:
-                    updated.append(new_item)
+        deleted = [subject_id for subject_id in old_fingerprints if subject_id not in seen_ids]
         
-        return added, updated, [int(id) for id in deleted]
+        return added, updated, deleted
         
     def save_database_id(self, database_id: str) -> bool:
         """保存Notion数据库ID到缓存文件"""
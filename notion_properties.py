@@ -0,0 +1,128 @@
+def build_page_properties(record, subject_detail, cover_image):
+    """根据收藏记录和条目详情构建 Notion 页面属性"""
+    # 收藏状态映射
+    collection_type_map = {
+        1: "想看",
+        2: "看过",
+        3: "在看",
+        4: "搁置",
+        5: "抛弃"
+    }
+    
+    # 条目类型映射
+    subject_type_map = {
+        1: "书籍",
+        2: "动画",
+        3: "音乐",
+        4: "游戏",
+        6: "三次元"
+    }
+    
+    properties = {
+        "标题": {
+            "title": [
+                {
+                    "text": {
+                        "content": record.name
+                    }
+                }
+            ]
+        },
+        "中文名": {
+            "rich_text": [
+                {
+                    "text": {
+                        "content": record.name_cn
+                    }
+                }
+            ]
+        },
+        "类型": {
+            "select": {
+                "name": subject_type_map.get(record.subject_type, "未知")
+            }
+        },
+        "ID": {
+            "number": record.subject_id
+        },
+        "链接": {
+            "url": f"https://bgm.tv/subject/{record.subject_id}"
+        },
+        "收藏状态": {
+            "select": {
+                "name": collection_type_map.get(record.type, "未知")
+            }
+        }
+    }
+    
+    # 添加封面图片（如果有）
+    if cover_image:
+        properties["封面"] = {
+            "files": [
+                {
+                    "name": f"封面-{record.subject_id}",
+                    "type": "external",
+                    "external": {
+                        "url": cover_image
+                    }
+                }
+            ]
+        }
+    
+    # 添加评分信息（如果有）
+    if subject_detail and "rating" in subject_detail:
+        properties["评分"] = {
+            "number": subject_detail["rating"]["score"]
+        }
+        properties["评分人数"] = {
+            "number": subject_detail["rating"]["total"]
+        }
+        if "rank" in subject_detail["rating"] and subject_detail["rating"]["rank"]:
+            properties["排名"] = {
+                "number": subject_detail["rating"]["rank"]
+            }
+    
+    # 添加发行日期（如果有）
+    if subject_detail and "date" in subject_detail and subject_detail["date"]:
+        properties["发行日期"] = {
+            "date": {
+                "start": subject_detail["date"]
+            }
+        }
+    
+    # 添加标签信息（如果有）
+    if subject_detail and "tags" in subject_detail:
+        tags = []
+        for tag in subject_detail["tags"]:
+            tags.append({"name": tag["name"]})
+        if tags:
+            properties["标签"] = {
+                "multi_select": tags
+            }
+    
+    # 添加剧集数（如果有）
+    if subject_detail and "eps" in subject_detail:
+        properties["剧集数"] = {
+            "number": subject_detail["eps"]
+        }
+    
+    # 添加观看进度
+    if record.ep_status is not None:
+        properties["观看进度"] = {
+            "number": record.ep_status
+        }
+    
+    page_properties = {
+        "properties": properties
+    }
+    
+    # 如果有封面图片，设置为页面封面
+    if cover_image:
+        page_properties["cover"] = {
+            "type": "external",
+            "external": {
+                "url": cover_image
+            }
+        }
+    
+    return page_properties
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import cProfile
+import pstats
+import logging
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+class Profiler:
+    def __init__(self, output_dir: str = ".profile", cpu: bool = False, memory: bool = False, timing: bool = False):
+        """初始化性能分析器，默认所有分析项均关闭"""
+        self.output_dir = output_dir
+        self.cpu = cpu
+        self.memory = memory
+        self.timing = timing
+        self._cpu_profile: Optional[cProfile.Profile] = None
+        self._spans: Dict[str, Dict[str, float]] = {}
+        self._snapshots = []
+
+    @classmethod
+    def from_env(cls) -> "Profiler":
+        """从环境变量创建分析器
+
+        PROFILE 为逗号分隔的分析项（cpu、memory、timing，或 all），
+        PROFILE_DIR 为输出目录。
+        """
+        options = {option.strip().lower() for option in os.getenv('PROFILE', '').split(',') if option.strip()}
+        if "all" in options:
+            options = {"cpu", "memory", "timing"}
+        return cls(
+            output_dir=os.getenv('PROFILE_DIR', '.profile'),
+            cpu="cpu" in options,
+            memory="memory" in options,
+            timing="timing" in options
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.cpu or self.memory or self.timing
+
+    def start(self):
+        """开始整个运行过程的分析"""
+        if self.cpu:
+            self._cpu_profile = cProfile.Profile()
+            self._cpu_profile.enable()
+
+    def stop(self):
+        """结束分析并写出结果文件"""
+        if self._cpu_profile:
+            self._cpu_profile.disable()
+        if not self.enabled:
+            return
+
+        try:
+            if not os.path.exists(self.output_dir):
+                os.makedirs(self.output_dir)
+
+            if self._cpu_profile:
+                self._write_cpu_profile()
+            if self.memory:
+                self._write_memory_snapshots()
+            if self.timing:
+                self._write_spans()
+            logger.info(f"性能分析结果已写入: {self.output_dir}")
+        except Exception as e:
+            logger.error(f"写入性能分析结果失败: {str(e)}")
+
+    @contextmanager
+    def span(self, name: str):
+        """记录一个阶段的耗时，同名阶段累计次数与总耗时
+
+        跟踪内存分配时 tracemalloc 会明显拖慢代码，此时的耗时会被标记为不可信。
+        """
+        if not self.timing:
+            yield
+            return
+
+        traced = tracemalloc.is_tracing()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self._spans.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0, "traced": False})
+            stats["count"] += 1
+            stats["total"] += elapsed
+            stats["max"] = max(stats["max"], elapsed)
+            stats["traced"] = stats["traced"] or traced
+
+    @contextmanager
+    def track_allocations(self, name: str):
+        """跟踪代码块内的内存分配，记录结束时的快照"""
+        if not self.memory:
+            yield
+            return
+
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(25)
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            self._snapshots.append((name, before, tracemalloc.take_snapshot(), current, peak))
+            if started_here:
+                tracemalloc.stop()
+
+    def _write_cpu_profile(self):
+        """写出 cProfile 原始数据和按累计耗时排序的文本报告"""
+        self._cpu_profile.dump_stats(os.path.join(self.output_dir, "cpu.prof"))
+        with open(os.path.join(self.output_dir, "cpu.txt"), 'w', encoding='utf-8') as f:
+            stats = pstats.Stats(self._cpu_profile, stream=f)
+            stats.sort_stats("cumulative").print_stats(100)
+
+    def _write_memory_snapshots(self):
+        """写出每个跟踪阶段的内存峰值和新增分配最多的代码位置"""
+        with open(os.path.join(self.output_dir, "memory.txt"), 'w', encoding='utf-8') as f:
+            for name, before, after, current, peak in self._snapshots:
+                f.write(f"== {name}: 当前 {current / 1024 / 1024:.2f} MiB, 峰值 {peak / 1024 / 1024:.2f} MiB\n")
+                for stat in after.compare_to(before, "lineno")[:30]:
+                    f.write(f"{stat}\n")
+                f.write("\n")
+
+    def _write_spans(self):
+        """写出各阶段耗时统计"""
+        data: Dict[str, Any] = {
+            name: {
+                "count": stats["count"],
+                "total_seconds": round(stats["total"], 6),
+                "max_seconds": round(stats["max"], 6),
+                # 为 True 时耗时包含 tracemalloc 的开销，需关闭 memory 后重新测量
+                "tracemalloc": stats["traced"]
+            }
+            for name, stats in sorted(self._spans.items(), key=lambda item: item[1]["total"], reverse=True)
+        }
+        with open(os.path.join(self.output_dir, "timing.json"), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
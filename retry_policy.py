@@ -0,0 +1,26 @@
+from typing import Optional, Union
+
+# 遇到这些状态码时按退避策略重试
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 单个请求的默认最大重试次数
+MAX_RETRIES = 5
+
+def should_retry(status: Optional[Union[int, str]], idempotent: bool = True) -> bool:
+    """判断失败的请求是否可以直接重试
+
+    创建页面等非幂等请求只在 429 时重试，此时服务端明确没有执行该请求；
+    其他错误下请求可能已经生效，需要由调用方确认后再决定是否重试。
+    """
+    if not idempotent:
+        return status == 429
+    return status in RETRY_STATUS_CODES
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+    """计算重试等待时间，优先使用服务端返回的 Retry-After"""
+    if retry_after:
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+    return min(2 ** attempt, 60)
@@ -0,0 +1,239 @@
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class StandInServer:
+    """在本地同时模拟 Bangumi API 和 Notion API，用于比较不同同步引擎的结果
+
+    Notion 路径以 /v1/ 开头，其余路径按 Bangumi API 处理。
+    """
+
+    def __init__(self, collections):
+        self.collections = collections
+        self.pages = {}
+        self.lock = threading.Lock()
+        # 写入时返回 400 的条目 ID
+        self.fail_subject_ids = set()
+        # 前 N 个同步数据的请求返回限流或服务不可用（不影响用户信息和数据库设置）
+        self.notion_rate_limited = 0
+        self.bgm_unavailable = 0
+        # 前 N 个创建页面的请求在页面创建后仍返回 502，模拟结果未知的写入
+        self.notion_create_errors = 0
+        # 每个请求的模拟延迟（秒）
+        self.delay = 0.0
+        # 按到达顺序记录的 (方法, 路径)
+        self.requests = []
+        self.inflight = {"bangumi": 0, "notion": 0}
+        self.max_inflight = {"bangumi": 0, "notion": 0}
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def duplicate_page(self, subject_id):
+        """复制一个已有页面，模拟数据库中的重复条目"""
+        with self.lock:
+            page = next(page for page in self.pages.values() if page["properties"]["ID"]["number"] == subject_id)
+            duplicate = json.loads(json.dumps(page))
+            duplicate["id"] = str(uuid.uuid4())
+            duplicate["last_edited_time"] = "2000-01-01T00:00:00.000Z"
+            self.pages[duplicate["id"]] = duplicate
+
+    def page_count(self):
+        """返回未归档页面的数量，用于发现重复创建的页面"""
+        with self.lock:
+            return sum(not page["archived"] for page in self.pages.values())
+
+    def end_state(self):
+        """按条目 ID 返回所有未归档页面的属性和封面"""
+        with self.lock:
+            return {
+                page["properties"]["ID"]["number"]: json.dumps(
+                    {"properties": page["properties"], "cover": page["cover"]}, sort_keys=True, ensure_ascii=False
+                )
+                for page in self.pages.values() if not page["archived"]
+            }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+            def _send(self, status, body=None, headers=None):
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                host = "notion" if url.path.startswith("/v1/") else "bangumi"
+                with server.lock:
+                    server.requests.append((method, url.path))
+                    server.inflight[host] += 1
+                    server.max_inflight[host] = max(server.max_inflight[host], server.inflight[host])
+                try:
+                    if server.delay:
+                        time.sleep(server.delay)
+                    if host == "notion":
+                        self._notion(method, url.path, body)
+                    else:
+                        self._bangumi(url.path, parse_qs(url.query))
+                finally:
+                    with server.lock:
+                        server.inflight[host] -= 1
+
+            def _bangumi(self, path, query):
+                with server.lock:
+                    unavailable = server.bgm_unavailable > 0 and path != "/v0/me"
+                    if unavailable:
+                        server.bgm_unavailable -= 1
+                if unavailable:
+                    return self._send(503, {"title": "Service Unavailable"}, {"Retry-After": "0"})
+
+                if path == "/v0/me":
+                    return self._send(200, {"username": "tester"})
+                if path == "/v0/users/tester/collections":
+                    limit = int(query.get("limit", ["50"])[0])
+                    offset = int(query.get("offset", ["0"])[0])
+                    return self._send(200, {
+                        "data": server.collections[offset:offset + limit],
+                        "total": len(server.collections),
+                        "limit": limit,
+                        "offset": offset
+                    })
+                match = re.match(r"^/v0/subjects/(\d+)/image$", path)
+                if match:
+                    return self._send(302, None, {"Location": f"https://lain.bgm.tv/pic/cover/l/{match.group(1)}.jpg"})
+                match = re.match(r"^/v0/subjects/(\d+)$", path)
+                if match:
+                    subject_id = int(match.group(1))
+                    return self._send(200, {
+                        "id": subject_id,
+                        "date": "2020-01-%02d" % (subject_id % 28 + 1),
+                        "eps": subject_id % 24,
+                        "rating": {"score": subject_id % 100 / 10, "total": subject_id * 3, "rank": subject_id % 7},
+                        "tags": [{"name": f"tag{subject_id % 5}"}, {"name": "common"}]
+                    })
+                return self._send(404, {"title": "Not Found"})
+
+            def _notion(self, method, path, body):
+                with server.lock:
+                    rate_limited = server.notion_rate_limited > 0 and not re.match(r"^/v1/databases/[^/]+$", path)
+                    if rate_limited:
+                        server.notion_rate_limited -= 1
+                if rate_limited:
+                    return self._send(429, {"object": "error", "status": 429, "code": "rate_limited",
+                                            "message": "Rate limited"}, {"Retry-After": "0"})
+
+                match = re.match(r"^/v1/databases/([^/]+)$", path)
+                if match:
+                    return self._send(200, {"object": "database", "id": match.group(1),
+                                            "properties": {"标题": {"id": "title", "title": {}}}})
+                match = re.match(r"^/v1/databases/([^/]+)/query$", path)
+                if match:
+                    return self._query(body)
+                if path == "/v1/pages" and method == "POST":
+                    return self._create_page(body)
+                match = re.match(r"^/v1/pages/([^/]+)$", path)
+                if match and method == "PATCH":
+                    return self._update_page(match.group(1), body)
+                return self._send(404, {"object": "error", "status": 404, "code": "object_not_found", "message": path})
+
+            def _query(self, body):
+                with server.lock:
+                    pages = sorted((page for page in server.pages.values() if not page["archived"]), key=lambda page: page["id"])
+                if body.get("filter"):
+                    subject_id = body["filter"]["number"]["equals"]
+                    results = [page for page in pages if page["properties"]["ID"]["number"] == subject_id]
+                    return self._send(200, {"object": "list", "results": results, "has_more": False, "next_cursor": None})
+                start = int(body.get("start_cursor") or 0)
+                end = start + 100
+                return self._send(200, {
+                    "object": "list",
+                    "results": pages[start:end],
+                    "has_more": end < len(pages),
+                    "next_cursor": str(end) if end < len(pages) else None
+                })
+
+            def _create_page(self, body):
+                if body["properties"]["ID"]["number"] in server.fail_subject_ids:
+                    return self._send(400, {"object": "error", "status": 400, "code": "validation_error",
+                                            "message": "Invalid page"})
+                page = {
+                    "object": "page",
+                    "id": str(uuid.uuid4()),
+                    "archived": False,
+                    "properties": body["properties"],
+                    "cover": body.get("cover"),
+                    "last_edited_time": "2020-01-01T00:00:00.000Z"
+                }
+                with server.lock:
+                    server.pages[page["id"]] = page
+                    failed = server.notion_create_errors > 0
+                    if failed:
+                        server.notion_create_errors -= 1
+                if failed:
+                    return self._send(502, {"object": "error", "status": 502, "code": "bad_gateway",
+                                            "message": "Bad gateway"})
+                return self._send(200, page)
+
+            def _update_page(self, page_id, body):
+                with server.lock:
+                    page = server.pages[page_id]
+                    if body.get("properties", {}).get("ID", {}).get("number") in server.fail_subject_ids:
+                        return self._send(400, {"object": "error", "status": 400, "code": "validation_error",
+                                                "message": "Invalid page"})
+                    if "archived" in body:
+                        page["archived"] = body["archived"]
+                    page["properties"].update(body.get("properties", {}))
+                    if "cover" in body:
+                        page["cover"] = body["cover"]
+                return self._send(200, page)
+
+        return Handler
+
+
+def collection(subject_id, collection_type=2, ep_status=None):
+    """构造一条 Bangumi 收藏数据"""
+    return {
+        "subject": {
+            "id": subject_id,
+            "name": f"Subject {subject_id}",
+            "name_cn": f"条目 {subject_id}" if subject_id % 3 else "",
+            "type": [1, 2, 3, 4, 6][subject_id % 5],
+            "images": {"large": f"https://lain.bgm.tv/pic/cover/l/{subject_id}.jpg"}
+        },
+        "type": collection_type,
+        "ep_status": subject_id % 4 if ep_status is None else ep_status,
+        "updated_at": "2020-01-01T00:00:00+08:00"
+    }
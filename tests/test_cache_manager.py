@@ -0,0 +1,77 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_manager import CacheManager, CollectionRecord, unique_records
+
+from stand_in_servers import collection
+
+
+def record(subject_id, collection_type=2, ep_status=1):
+    return CollectionRecord.from_dict(collection(subject_id, collection_type, ep_status))
+
+
+def ids(records):
+    return [item.subject_id for item in records]
+
+
+def test_old_full_json_cache_round_trips(tmp_path):
+    # 旧版缓存直接保存 Bangumi API 返回的完整数据
+    full = collection(42, collection_type=3, ep_status=7)
+    full["subject"].update({"short_summary": "...", "tags": [{"name": "tag", "count": 1}], "score": 7.5})
+    full.update({"rate": 8, "comment": "", "private": False})
+    cache_manager = CacheManager(str(tmp_path))
+    with open(cache_manager.cache_file, 'w', encoding='utf-8') as f:
+        json.dump({"data": [full], "total": 1}, f, ensure_ascii=False)
+
+    [loaded] = cache_manager.load_cache()
+    assert loaded.to_dict() == {
+        "subject": {"id": 42, "name": "Subject 42", "name_cn": "", "type": 3},
+        "type": 3,
+        "ep_status": 7
+    }
+
+    cache_manager.save_cache([loaded])
+    [reloaded] = cache_manager.load_cache()
+    assert reloaded.to_dict() == loaded.to_dict()
+    assert reloaded.fingerprint() == CollectionRecord.from_dict(full).fingerprint()
+
+
+def test_missing_optional_fields():
+    item = {"subject": {"id": "7", "name": None}, "type": 1}
+    loaded = CollectionRecord.from_dict(item)
+    assert loaded.subject_id == 7
+    assert loaded.to_dict() == {"subject": {"id": 7, "name": "", "name_cn": "", "type": None}, "type": 1}
+    assert CollectionRecord.from_dict(loaded.to_dict()).fingerprint() == loaded.fingerprint()
+
+
+def test_compare_collections(tmp_path):
+    old = [record(1), record(2), record(3), record(4)]
+    new = [record(1), record(2, collection_type=3), record(3, ep_status=2), record(5)]
+
+    added, updated, deleted = CacheManager(str(tmp_path)).compare_collections(new, old)
+
+    assert ids(added) == [5]
+    assert ids(updated) == [2, 3]
+    assert deleted == [4]
+
+
+def test_compare_collections_ignores_duplicates(tmp_path):
+    old = [record(1)]
+    new = [record(2), record(1, collection_type=3), record(2, collection_type=4), record(1)]
+
+    added, updated, deleted = CacheManager(str(tmp_path)).compare_collections(new, old)
+
+    assert ids(added) == [2]
+    assert added[0].type == 2
+    assert ids(updated) == [1]
+    assert deleted == []
+
+
+def test_unique_records_keeps_first_occurrence():
+    records = unique_records([record(3), record(1), record(3, collection_type=4), record(2), record(1)])
+
+    assert ids(records) == [3, 1, 2]
+    assert records[0].type == 2
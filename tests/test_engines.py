@@ -0,0 +1,178 @@
+import copy
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from stand_in_servers import StandInServer, collection
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bgm_to_notion.py")
+
+INITIAL = [collection(subject_id) for subject_id in range(1, 121)]
+
+
+def changed_collections():
+    """在初始收藏的基础上删除、修改并新增部分条目"""
+    collections = [item for item in copy.deepcopy(INITIAL) if item["subject"]["id"] % 17]
+    for item in collections:
+        if item["subject"]["id"] % 5 == 0:
+            item["type"] = 3
+        if item["subject"]["id"] % 7 == 0:
+            item["ep_status"] = 99
+    collections += [collection(subject_id) for subject_id in range(500, 530)]
+    return collections
+
+
+def run_sync(server, workdir, engine="sync", shard_index=None, shard_count=None, **env_overrides):
+    """以子进程运行同步脚本，缓存写入 workdir/.cache"""
+    env = dict(
+        os.environ,
+        BGM_TOKEN="test-token",
+        NOTION_TOKEN="test-token",
+        NOTION_DATABASE_ID="database",
+        BGM_API_BASE=server.url,
+        NOTION_API_BASE=server.url,
+        SYNC_ENGINE=engine,
+        SHARD_INDEX=shard_index or "",
+        SHARD_COUNT=shard_count or "",
+        BGM_RATE_LIMIT="1000",
+        NOTION_RATE_LIMIT="1000",
+        PROFILE=""
+    )
+    env.update(env_overrides)
+    return subprocess.run([sys.executable, SCRIPT], cwd=workdir, env=env, capture_output=True, text=True, timeout=300)
+
+
+def run_mode(server, workdir, mode, **env_overrides):
+    """按指定模式完成一次完整同步"""
+    if mode == "sharded":
+        for shard_index in range(3):
+            assert run_sync(server, workdir, shard_index=str(shard_index), shard_count="3", **env_overrides).returncode == 0
+        return run_sync(server, workdir, shard_index="merge", shard_count="3", **env_overrides)
+    return run_sync(server, workdir, engine=mode, **env_overrides)
+
+
+def cached_collections(workdir):
+    """按条目 ID 排序返回缓存的收藏数据"""
+    with open(os.path.join(workdir, ".cache", "bgm_cache.json"), encoding="utf-8") as f:
+        return sorted(json.load(f)["data"], key=lambda item: item["subject"]["id"])
+
+
+def run_scenario(server, workdir, mode, **env_overrides):
+    """首次导入，加入重复页面后再同步一次修改过的收藏"""
+    assert run_mode(server, workdir, mode, **env_overrides).returncode == 0
+    server.duplicate_page(5)
+    server.collections = changed_collections()
+    assert run_mode(server, workdir, mode, **env_overrides).returncode == 0
+    return server.end_state(), cached_collections(workdir)
+
+
+@pytest.fixture(scope="module")
+def sync_engine_result(tmp_path_factory):
+    with StandInServer(copy.deepcopy(INITIAL)) as server:
+        return run_scenario(server, tmp_path_factory.mktemp("sync"), "sync")
+
+
+@pytest.mark.parametrize("mode", ["async", "sharded"])
+def test_same_end_state_as_sync_engine(sync_engine_result, tmp_path, mode):
+    with StandInServer(copy.deepcopy(INITIAL)) as server:
+        # 加入延迟，使并发请求在服务端重叠
+        server.delay = 0.005
+        end_state, cache = run_scenario(server, tmp_path, mode)
+        max_inflight = server.max_inflight
+
+    expected_state, expected_cache = sync_engine_result
+    assert end_state == expected_state
+    assert cache == expected_cache
+    assert sum('"删除"' in page for page in end_state.values()) == len([i for i in range(1, 121) if i % 17 == 0])
+    if mode == "async":
+        assert 1 < max_inflight["notion"] <= 3
+        assert 1 < max_inflight["bangumi"] <= 8
+
+
+@pytest.mark.parametrize("mode", ["sync", "async", "sharded"])
+def test_retries_rate_limited_requests(sync_engine_result, tmp_path, mode):
+    with StandInServer(copy.deepcopy(INITIAL)) as server:
+        # 少于最大重试次数，保证即使全部落在同一个请求上也能成功
+        server.notion_rate_limited = 5
+        server.bgm_unavailable = 5
+        end_state, cache = run_scenario(server, tmp_path, mode)
+
+    assert (end_state, cache) == sync_engine_result
+
+
+@pytest.mark.parametrize("mode", ["sync", "async", "sharded"])
+def test_create_with_unknown_result_is_not_duplicated(tmp_path, mode):
+    with StandInServer(copy.deepcopy(INITIAL)) as server:
+        server.notion_create_errors = 3
+        assert run_mode(server, tmp_path, mode).returncode == 0
+        assert server.notion_create_errors == 0
+        assert server.page_count() == len(INITIAL)
+        assert len(cached_collections(tmp_path)) == len(INITIAL)
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_writes_keep_up_with_lookups(tmp_path, mode):
+    with StandInServer(copy.deepcopy(INITIAL)) as server:
+        server.delay = 0.005
+        assert run_sync(server, tmp_path, engine=mode).returncode == 0
+        notion_requests = [request for request in server.requests if request[1].startswith("/v1/pages") or request[1].endswith("/query")]
+
+    # 每个条目先查询再创建，未创建的查询数不应超过 Notion 的并发数
+    pending = 0
+    for method, path in notion_requests:
+        pending += 1 if path.endswith("/query") else -1
+        assert pending <= 3
+    assert notion_requests.count(("POST", "/v1/pages")) == len(INITIAL)
+
+
+@pytest.mark.parametrize("mode", ["sync", "async", "sharded"])
+def test_failed_writes_are_retried_next_run(tmp_path, mode):
+    failing = {3, 40, 77}
+    with StandInServer(copy.deepcopy(INITIAL)) as server:
+        server.fail_subject_ids = failing
+        result = run_mode(server, tmp_path, mode)
+        assert result.returncode == 0
+        assert len(server.end_state()) == len(INITIAL) - len(failing)
+        assert not failing & {item["subject"]["id"] for item in cached_collections(tmp_path)}
+
+        server.fail_subject_ids = set()
+        assert run_mode(server, tmp_path, mode).returncode == 0
+        assert len(server.end_state()) == len(INITIAL)
+        assert len(cached_collections(tmp_path)) == len(INITIAL)
+
+
+@pytest.mark.parametrize("mode", ["sync", "async", "sharded"])
+def test_duplicate_collections_are_cached_once(tmp_path, mode):
+    # 模拟分页过程中收藏变动，同一条目出现在两页中
+    with StandInServer(copy.deepcopy(INITIAL) + [collection(10), collection(75)]) as server:
+        assert run_mode(server, tmp_path, mode).returncode == 0
+
+    cached_ids = [item["subject"]["id"] for item in cached_collections(tmp_path)]
+    assert cached_ids == list(range(1, 121))
+
+
+@pytest.mark.parametrize("mode", ["sync", "async"])
+def test_profiler_writes_results(tmp_path, mode):
+    profile_dir = tmp_path / "profile"
+    with StandInServer(copy.deepcopy(INITIAL)) as server:
+        # 第二次同步包含更新和删除，覆盖所有需要记录的阶段
+        run_scenario(server, tmp_path, mode, PROFILE="all", PROFILE_DIR=str(profile_dir))
+
+    assert (profile_dir / "cpu.prof").stat().st_size > 0
+    assert "compare_collections" in (profile_dir / "memory.txt").read_text(encoding="utf-8")
+    timing = json.loads((profile_dir / "timing.json").read_text(encoding="utf-8"))
+    for span in ["get_user_collections", "compare_collections", "add_to_notion_database", "mark_deleted_items"]:
+        assert timing[span]["count"] > 0
+    # 内存分析开启时，比较阶段在 tracemalloc 跟踪期间计时
+    assert timing["compare_collections"]["tracemalloc"]
+
+
+def test_invalid_shard_config_exits_with_error(tmp_path):
+    with StandInServer(copy.deepcopy(INITIAL)) as server:
+        result = run_sync(server, tmp_path, shard_index="one", shard_count="3")
+
+    assert result.returncode == 1
+    assert "无效的分片配置" in result.stderr